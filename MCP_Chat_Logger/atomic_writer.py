@@ -0,0 +1,175 @@
+from typing import List, Any, Callable, Optional
+import os
+import re
+import time
+import uuid
+import asyncio
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking is available
+    fcntl = None
+
+# Hidden temp file a commit writes before publishing it: .<uuid hex>.tmp
+TEMP_FILE_PATTERN = re.compile(r"\.[0-9a-f]{32}\.tmp")
+
+_stamp_lock = threading.Lock()
+_last_stamp_us = 0
+
+def next_file_stamp() -> str:
+    """Return a filename timestamp that strictly increases within this process"""
+    global _last_stamp_us
+    with _stamp_lock:
+        now_us = int(datetime.now().timestamp() * 1_000_000)
+        _last_stamp_us = max(now_us, _last_stamp_us + 1)
+        stamp_us = _last_stamp_us
+    return datetime.fromtimestamp(stamp_us / 1_000_000).strftime("%Y%m%d_%H%M%S_%f")
+
+@contextmanager
+def file_lock(lock_path: str, thread_lock: threading.Lock):
+    """Hold thread_lock and an exclusive flock on lock_path, so threads and processes both wait"""
+    with thread_lock:
+        with open(lock_path, "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def fsync_directory(directory: str):
+    """Persist renames in directory; not supported on every platform"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def publish_file(tmp_path: str, directory: str, make_name: Callable[[str], str]) -> str:
+    """
+    Give a synced temp file its final, unique name
+
+    os.link fails instead of overwriting when the name is taken (for example
+    by another logger process in the same microsecond), so we retry with the
+    next stamp.
+    """
+    while True:
+        final_path = os.path.join(directory, make_name(next_file_stamp()))
+        try:
+            os.link(tmp_path, final_path)
+        except FileExistsError:
+            continue
+        except OSError:
+            # Filesystems without hard links: fall back to a plain rename
+            if os.path.exists(final_path):
+                continue
+            os.replace(tmp_path, final_path)
+            return final_path
+        os.unlink(tmp_path)
+        return final_path
+
+def remove_stale_temp_files(directory: str, older_than_seconds: float) -> int:
+    """
+    Delete commit temp files left in directory by a process that stopped before publishing them
+
+    Only files older than older_than_seconds are removed, so a commit still
+    in flight in another logger process keeps its temp file.
+    """
+    removed = 0
+    cutoff = time.time() - older_than_seconds
+    for name in os.listdir(directory):
+        if not TEMP_FILE_PATTERN.fullmatch(name):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+class GroupCommitter:
+    """
+    Batches file commits so concurrent saves share one directory fsync
+
+    Each commit writes its content to a hidden temp file right away. Commits
+    that arrive within the window are then fsynced, linked to their final
+    names and made durable with a single fsync of the directory.
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self.pending: List[tuple] = []
+        self.flush_task: Optional[asyncio.Task] = None
+
+    async def commit(self, directory: str, make_name: Callable[[str], str], text: str) -> str:
+        """Atomically write text under a unique name from make_name(stamp) and return its path"""
+        tmp_path = os.path.join(directory, f".{uuid.uuid4().hex}.tmp")
+        await asyncio.to_thread(self._write_temp, tmp_path, text)
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((tmp_path, directory, make_name, future))
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self._flush_after_window())
+        return await future
+
+    @staticmethod
+    def _write_temp(tmp_path: str, text: str):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    async def _flush_after_window(self):
+        batch = None
+        try:
+            await asyncio.sleep(self.window_seconds)
+            batch, self.pending = self.pending, []
+            self.flush_task = None
+            results = await asyncio.to_thread(self._commit_batch, batch)
+            for (_, _, _, future), result in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            # Cancelled or failed: let the next commit start a new flush
+            if self.flush_task is asyncio.current_task():
+                self.flush_task = None
+            if batch is None:
+                # Cancelled during the window, so these temp files are never published
+                batch, self.pending = self.pending, []
+                for tmp_path, _, _, _ in batch:
+                    try:
+                        os.unlink(tmp_path)
+                    except FileNotFoundError:
+                        pass
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Commit was interrupted before it completed"))
+
+    @staticmethod
+    def _commit_batch(batch: List[tuple]) -> List[Any]:
+        results = []
+        directories = set()
+        for tmp_path, directory, make_name, _ in batch:
+            try:
+                with open(tmp_path, "rb") as f:
+                    os.fsync(f.fileno())
+                results.append(publish_file(tmp_path, directory, make_name))
+                directories.add(directory)
+            except Exception as e:
+                results.append(e)
+        for directory in directories:
+            fsync_directory(directory)
+        return results
@@ -1,66 +1,27 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any
 import os
+import sys
 import json
-import uuid
+import asyncio
 import re
-from datetime import datetime
 from mcp.server.fastmcp import FastMCP
 import google.generativeai as genai
-from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from prompt_reducer import reduce_conversation
+from exporter import export_history
+import conversation_store
+import journal
+from conversation_store import ensure_logs_directory, ensure_indexes, write_markdown
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize FastMCP server
-mcp = FastMCP("chat_logger")
-
-# Pydantic models for data validation
-class ChatMessage(BaseModel):
-    role: str
-    content: str
-    timestamp: str = Field(default_factory=lambda: datetime.now().isoformat())
-
-class ConversationSummary(BaseModel):
-    conversation_id: str
-    project_name: str = "MCP_Chat_Logger"
-    tag: str = "function modify"  # bug fixed/function added/function modify
-    description: str = ""
-    before_code: Optional[str] = None
-    after_code: Optional[str] = None
-    title: Optional[str] = None
-    summary: Optional[str] = None
-    message_count: int
-    participants: List[str]
-    created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
-    updated_at: str = Field(default_factory=lambda: datetime.now().isoformat())
-    messages: List[ChatMessage]
-
-def ensure_logs_directory():
-    """Ensure the logs directory exists"""
-    if not os.path.exists("chat_logs"):
-        os.makedirs("chat_logs")
-
-def format_message(message: Dict[str, Any]) -> str:
-    """Format message into Markdown format"""
-    role = message.get("role", "unknown")
-    content = message.get("content", "")
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    return f"""
-### {role.capitalize()} - {timestamp}
-
-{content}
-
----
-"""
-
 def analyze_conversation_with_gemini(messages: List[Dict[str, Any]]) -> Dict[str, str]:
     """Use Gemini to analyze the entire conversation and extract code changes"""
     # Set API key from environment variable
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
-        print("❌ GEMINI_API_KEY not found in environment variables")
+        print("❌ GEMINI_API_KEY not found in environment variables", file=sys.stderr)
         return {
             "tag": "other",
             "description": "Gemini API key not configured",
@@ -74,21 +35,9 @@ def analyze_conversation_with_gemini(messages: List[Dict[str, Any]]) -> Dict[str
     genai.configure(api_key=api_key)
     
     try:
-        # Format conversation for analysis
-        conversation_text = ""
-        for msg in messages:
-            role = msg.get("role", "unknown")
-            content = msg.get("content", "")
-            conversation_text += f"{role.upper()}: {content}\n\n"
-        
-        # Extract all code blocks from conversation
-        all_code_blocks = []
-        for msg in messages:
-            content = msg.get("content", "")
-            code_blocks = re.findall(r'```(?:python|py|javascript|js|typescript|ts|java|cpp|c|html|css|sql|bash|sh)?\n(.*?)```', content, re.DOTALL)
-            for code_block in code_blocks:
-                if len(code_block.strip()) > 50:
-                    all_code_blocks.append(code_block.strip())
+        # Format conversation for analysis, deduplicated and within the token budget
+        conversation_text, token_stats = reduce_conversation(messages)
+        print(f"📉 Prompt reduced from {token_stats['tokens_before']} to {token_stats['tokens_after']} tokens", file=sys.stderr)
         
         # Create prompt for OpenAI
         prompt = f"""
@@ -97,9 +46,6 @@ Analyze this programming conversation and extract code changes:
 Conversation:
 {conversation_text}
 
-Code blocks found in conversation:
-{chr(10).join(f"```{i+1}: {code[:200]}...```" for i, code in enumerate(all_code_blocks))}
-
 Please provide a JSON response with the following fields:
 {{
     "tag": "bug fixed" | "function added" | "function modify" | "question" | "discussion" | "other",
@@ -151,7 +97,7 @@ Focus on:
             }
             
     except Exception as e:
-        print(f"Error in OpenAI analysis: {e}")
+        print(f"Error in OpenAI analysis: {e}", file=sys.stderr)
         return {
             "tag": "other",
             "description": "AI analysis failed",
@@ -161,6 +107,15 @@ Focus on:
             "after_code": None
         }
 
+async def write_conversation(messages: List[Dict[str, Any]], conversation_id: str = None,
+                             project_name: str = "MCP_Chat_Logger", use_ai_analysis: bool = True) -> str:
+    """Analyze a full conversation with Gemini and save it, returning the filename"""
+    analyze = analyze_conversation_with_gemini if use_ai_analysis else None
+    return await conversation_store.write_conversation(messages, conversation_id, project_name, analyze)
+
+# Initialize FastMCP server; journals left by a previous run are picked up at startup
+mcp = FastMCP("chat_logger", lifespan=journal.recovery_lifespan(analyze_conversation_with_gemini))
+
 @mcp.tool()
 async def save_chat_history(messages: List[Dict[str, Any]], conversation_id: str = None, 
                            project_name: str = "MCP_Chat_Logger", use_ai_analysis: bool = True) -> str:
@@ -173,72 +128,41 @@ async def save_chat_history(messages: List[Dict[str, Any]], conversation_id: str
         project_name: Project name (default: MCP_Chat_Logger)
         use_ai_analysis: Whether to use AI to analyze the entire conversation (default: True)
     """
-    ensure_logs_directory()
-    
-    # Generate conversation ID if not provided
-    if not conversation_id:
-        conversation_id = str(uuid.uuid4())
-    
-    # Use AI to analyze the entire conversation
-    if use_ai_analysis:
-        print("🤖 Analyzing entire conversation with Gemini...")
-        ai_analysis = analyze_conversation_with_gemini(messages)
-        
-        title = ai_analysis.get("title", "Chat Conversation")
-        summary = ai_analysis.get("summary", "No summary available")
-        tag = ai_analysis.get("tag", "other")
-        description = ai_analysis.get("description", "No description available")
-        before_code = ai_analysis.get("before_code") or None
-        after_code = ai_analysis.get("after_code") or None
-        
-        print(f"✅ AI Analysis: {tag} - {description[:50]}...")
-    else:
-        title = "Chat Conversation"
-        summary = "No summary available"
-        tag = "other"
-        description = "No description available"
-        before_code = None
-        after_code = None
-    
-    # Extract participants
-    participants = list(set(msg.get("role", "unknown") for msg in messages))
+    filename = await write_conversation(messages, conversation_id, project_name, use_ai_analysis)
+    return f"✅ Conversation saved to JSON file: {filename}"
+
+@mcp.tool()
+async def append_chat_messages(conversation_id: str, messages: List[Dict[str, Any]],
+                               project_name: str = "MCP_Chat_Logger", use_ai_analysis: bool = True) -> str:
+    """
+    Append new messages to an open conversation without resending the history
     
-    # Convert messages to ChatMessage objects
-    chat_messages = []
-    for msg in messages:
-        chat_messages.append(ChatMessage(
-            role=msg.get("role", "unknown"),
-            content=msg.get("content", ""),
-            timestamp=msg.get("timestamp", datetime.now().isoformat())
-        ))
+    Messages are written to a per-conversation journal. Analysis runs once, when
+    finalize_conversation is called or the conversation has been idle for the
+    debounce period.
     
-    # Create conversation summary
-    conversation = ConversationSummary(
-        conversation_id=conversation_id,
-        project_name=project_name,
-        tag=tag,
-        description=description,
-        before_code=before_code,
-        after_code=after_code,
-        title=title,
-        summary=summary,
-        message_count=len(messages),
-        participants=participants,
-        messages=chat_messages
+    Args:
+        conversation_id: Conversation ID the messages belong to
+        messages: New chat messages only, each containing role and content
+        project_name: Project name, recorded when the journal is first opened
+        use_ai_analysis: Whether to run AI analysis on finalize, recorded when the journal is first opened
+    """
+    return await journal.append_messages(
+        conversation_id, messages, project_name, use_ai_analysis, analyze_conversation_with_gemini
     )
+
+@mcp.tool()
+async def finalize_conversation(conversation_id: str) -> str:
+    """
+    Analyze an open conversation journal and save it as a JSON conversation file
     
-    # Save to JSON file
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"chat_logs/conversation_{conversation_id}_{timestamp}.json"
-    
-    # Convert to dict and save as JSON
-    conversation_dict = conversation.model_dump()
-    conversation_dict['messages'] = [msg.model_dump() for msg in conversation.messages]
-    
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(conversation_dict, f, indent=2, ensure_ascii=False)
+    The saved file holds the whole session: the messages of the conversation's
+    previous saved file followed by those appended since.
     
-    return f"✅ Conversation saved to JSON file: {filename}"
+    Args:
+        conversation_id: Conversation ID previously used with append_chat_messages
+    """
+    return await journal.finalize(conversation_id, analyze_conversation_with_gemini)
 
 @mcp.tool()
 async def save_chat_history_markdown(messages: List[Dict[str, Any]], conversation_id: str = None) -> str:
@@ -249,27 +173,30 @@ async def save_chat_history_markdown(messages: List[Dict[str, Any]], conversatio
         messages: List of chat messages, each containing role and content
         conversation_id: Optional conversation ID for file naming
     """
-    ensure_logs_directory()
-    
-    # Generate filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"chat_logs/chat_{conversation_id}_{timestamp}.md" if conversation_id else f"chat_logs/chat_{timestamp}.md"
-    
-    # Format all messages
-    formatted_content = "# Chat History\n\n"
-    formatted_content += f"Conversation ID: {conversation_id}\n" if conversation_id else ""
-    formatted_content += f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-    
-    for message in messages:
-        formatted_content += format_message(message)
-    
-    # Save file
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(formatted_content)
+    filename = await write_markdown(messages, conversation_id)
     
     return f"Chat history has been saved to file: {filename}"
 
+@mcp.tool()
+async def export_chat_history(output_dir: str = "exports", format: str = "parquet", full: bool = False) -> str:
+    """
+    Export saved conversations to partitioned summaries and messages tables for analytics
+    
+    Args:
+        output_dir: Directory to write the export to (default: exports)
+        format: "parquet", "arrow" (Arrow IPC) or "ndjson"; falls back to ndjson without pyarrow
+        full: Re-export all history instead of only conversations saved since the last export
+    """
+    ensure_logs_directory()
+    try:
+        result = await asyncio.to_thread(export_history, "chat_logs", output_dir, format, full)
+    except ValueError as e:
+        return f"❌ {e}"
+    return (f"✅ Exported {result['conversations']} conversations "
+            f"({result['summaries']} summaries, {result['messages']} messages) as {result['format']} to {output_dir}")
+
 if __name__ == "__main__":
     # Initialize and run the server
+    ensure_indexes()
     mcp.run(transport='stdio')
 
@@ -0,0 +1,535 @@
+"""
+Shared storage layer for the chat logger MCP servers
+
+Both chat_logger.py and simple_chat_logger.py save through this module, so
+every conversation is committed atomically and reaches the project stats,
+symbol and vector indexes no matter which server wrote it.
+"""
+from typing import List, Dict, Any, Optional, Callable
+import os
+import sys
+import json
+import asyncio
+import threading
+import uuid
+import re
+import ast
+import sqlite3
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pydantic import BaseModel, Field
+from atomic_writer import GroupCommitter, file_lock, remove_stale_temp_files
+from prompt_reducer import CODE_FENCE_PATTERN
+
+# Similarity search needs NumPy (a declared dependency); without it the
+# logger warns at startup and skips the vector index
+try:
+    import vector_index
+except ImportError:
+    vector_index = None
+
+# Per-project aggregates and search indexes maintained on every save and served by the dashboard
+INDEX_DIR = os.path.join("chat_logs", "index")
+INDEX_DB_PATH = os.path.join(INDEX_DIR, "index.sqlite")
+INDEX_LOCK_PATH = os.path.join(INDEX_DIR, "index.lock")
+VECTORS_PATH = os.path.join(INDEX_DIR, "vectors.f32")
+VECTOR_METADATA_PATH = os.path.join(INDEX_DIR, "vectors.jsonl")
+
+# Saves of the same conversation are ordered by a per-conversation lock;
+# different conversations run concurrently and share group-committed fsyncs.
+# Each entry is [lock, users] and is dropped once nobody holds or awaits it.
+_conversation_locks: Dict[str, list] = {}
+_index_thread_lock = threading.Lock()
+committer = GroupCommitter(float(os.getenv("CHAT_LOGGER_GROUP_COMMIT_WINDOW", "0.005")))
+
+# Commit temp files older than this at startup were left by a process that stopped mid-commit
+STALE_TEMP_SECONDS = 60
+
+# Pydantic models for data validation
+class ChatMessage(BaseModel):
+    role: str
+    content: str
+    timestamp: str = Field(default_factory=lambda: datetime.now().isoformat())
+
+class ConversationSummary(BaseModel):
+    conversation_id: str
+    project_name: str = "MCP_Chat_Logger"
+    tag: str = "function modify"  # bug fixed/function added/function modify
+    description: str = ""
+    before_code: Optional[str] = None
+    after_code: Optional[str] = None
+    title: Optional[str] = None
+    summary: Optional[str] = None
+    message_count: int
+    participants: List[str]
+    created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: str = Field(default_factory=lambda: datetime.now().isoformat())
+    messages: List[ChatMessage]
+
+def ensure_logs_directory():
+    """Ensure the logs directory exists"""
+    if not os.path.exists("chat_logs"):
+        os.makedirs("chat_logs")
+
+def format_message(message: Dict[str, Any]) -> str:
+    """Format message into Markdown format"""
+    role = message.get("role", "unknown")
+    content = message.get("content", "")
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    return f"""
+### {role.capitalize()} - {timestamp}
+
+{content}
+
+---
+"""
+
+def extract_function_names(code: str) -> List[str]:
+    """Extract function names from code"""
+    return re.findall(r'def\s+(\w+)\s*\(', code or "")
+
+def extract_file_names(code: str) -> List[str]:
+    """Extract file names from code"""
+    matches = re.findall(r'[\'"`]([^\'"`]*\.(py|js|ts|jsx|tsx|html|css|json|md))[\'"`]', code or "")
+    return [match[0] for match in matches]
+
+def add_to_project_stats(stats: Dict[str, Any], conversation: Dict[str, Any], counted: Optional[Dict[str, Any]] = None):
+    """
+    Fold one saved conversation into the per-project aggregates
+    
+    counted is what earlier saves of the same conversation already added
+    (message_count and participants). Each finalize re-saves the whole
+    session, so only the difference is added.
+    """
+    project_name = conversation.get("project_name", "Unknown Project")
+    project = stats.setdefault(project_name, {
+        "name": project_name,
+        "updates": 0,
+        "message_count": 0,
+        "first_update": None,
+        "last_update": None,
+        "updates_per_day": {},
+        "updates_per_week": {},
+        "tags": {},
+        "participants": {},
+        "functions": {},
+        "files": {}
+    })
+    
+    created_at = conversation.get("created_at") or datetime.now().isoformat()
+    try:
+        created = datetime.fromisoformat(created_at)
+    except ValueError:
+        created = datetime.now()
+    day = created.strftime("%Y-%m-%d")
+    iso_year, iso_week, _ = created.isocalendar()
+    week = f"{iso_year}-W{iso_week:02d}"
+    
+    project["updates"] += 1
+    counted = counted or {"message_count": 0, "participants": []}
+    project["message_count"] += conversation.get("message_count", 0) - counted["message_count"]
+    if not project["first_update"] or created_at < project["first_update"]:
+        project["first_update"] = created_at
+    if not project["last_update"] or created_at > project["last_update"]:
+        project["last_update"] = created_at
+    
+    def bump(counter: Dict[str, int], key: str):
+        counter[key] = counter.get(key, 0) + 1
+    
+    bump(project["updates_per_day"], day)
+    bump(project["updates_per_week"], week)
+    bump(project["tags"], conversation.get("tag") or "other")
+    for participant in set(conversation.get("participants", [])) - set(counted["participants"]):
+        bump(project["participants"], participant)
+    
+    after_code = conversation.get("after_code") or ""
+    for name in set(extract_function_names(after_code)):
+        bump(project["functions"], name)
+    for file_name in set(extract_file_names(after_code)):
+        bump(project["files"], file_name)
+
+def iter_saved_conversations(skip: frozenset = frozenset()):
+    """Yield (filename, data) for every conversation file already in chat_logs, except those in skip"""
+    for file in sorted(os.listdir("chat_logs")):
+        if not file.endswith(".json") or file in skip:
+            continue
+        try:
+            with open(os.path.join("chat_logs", file), "r", encoding="utf-8") as f:
+                yield file, json.load(f)
+        except Exception as e:
+            print(f"Error reading file {file}: {e}", file=sys.stderr)
+
+def latest_saved_conversation(conversation_id: str) -> Optional[Dict[str, Any]]:
+    """Return the newest saved file of a conversation, or None if it was never saved"""
+    pattern = re.compile(rf"conversation_{re.escape(conversation_id)}_(\d{{8}}_\d{{6}}(?:_\d{{6}})?)\.json")
+    stamps = [match.group(1) for match in map(pattern.fullmatch, os.listdir("chat_logs")) if match]
+    if not stamps:
+        return None
+    with open(os.path.join("chat_logs", f"conversation_{conversation_id}_{max(stamps)}.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def extract_code_blocks(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Extract fenced code blocks, with their language hint, from chat messages"""
+    code_blocks = []
+    for msg in messages:
+        content = msg.get("content", "")
+        for language, code in CODE_FENCE_PATTERN.findall(content):
+            if code.strip():
+                code_blocks.append({"language": language.lower(), "code": code.strip()})
+    return code_blocks
+
+def extract_symbols(code: str, language: str = "") -> List[str]:
+    """Extract function and class names, using the AST when the code parses as Python"""
+    if language in ("", "python", "py"):
+        try:
+            tree = ast.parse(code)
+            return [
+                node.name for node in ast.walk(tree)
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+            ]
+        except (SyntaxError, ValueError):
+            pass
+    # Fragments and other languages fall back to pattern matching
+    return re.findall(r'(?:def|class|function)\s+([A-Za-z_]\w*)', code)
+
+def build_symbol_entry(conversation: Dict[str, Any], code_blocks: List[Dict[str, str]]) -> Dict[str, List[str]]:
+    """Collect the symbols and referenced file names of one conversation"""
+    sources = [(block["code"], block["language"]) for block in code_blocks]
+    for field in ("before_code", "after_code"):
+        if conversation.get(field):
+            sources.append((conversation[field], ""))
+    
+    symbols = set()
+    files = set()
+    for code, language in sources:
+        symbols.update(extract_symbols(code, language))
+        files.update(extract_file_names(code))
+    for msg in conversation.get("messages", []):
+        files.update(extract_file_names(msg.get("content", "")))
+    
+    return {"symbols": sorted(symbols), "files": sorted(files)}
+
+# Project stats, code blocks and symbol postings share one database, so a
+# save updates all of them and records its file as indexed in a single
+# transaction. Symbol postings are one row per (name, conversation file):
+# a save only inserts its own rows and a lookup reads one key range.
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    file TEXT PRIMARY KEY,
+    conversation_id TEXT,
+    project_name TEXT,
+    title TEXT,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS refs (
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    file TEXT NOT NULL,
+    PRIMARY KEY (name, kind, file)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS code_blocks (
+    file TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    language TEXT NOT NULL,
+    code TEXT NOT NULL,
+    PRIMARY KEY (file, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS project_stats (
+    project_name TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversation_counts (
+    conversation_id TEXT PRIMARY KEY,
+    message_count INTEGER NOT NULL,
+    participants TEXT NOT NULL
+);
+"""
+
+def open_index() -> sqlite3.Connection:
+    """Open the index database, creating its tables if needed"""
+    db = sqlite3.connect(INDEX_DB_PATH)
+    # WAL lets the dashboard read while a save is writing; NORMAL syncs at
+    # checkpoints rather than on every commit, and stays consistent in WAL mode
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(INDEX_SCHEMA)
+    return db
+
+def update_project_stats(db: sqlite3.Connection, conversation: Dict[str, Any]):
+    """Fold a saved conversation into its project's row of aggregates"""
+    project_name = conversation.get("project_name", "Unknown Project")
+    row = db.execute("SELECT data FROM project_stats WHERE project_name = ?", (project_name,)).fetchone()
+    stats = {project_name: json.loads(row[0])} if row else {}
+    
+    # What earlier saves of this conversation already contributed
+    conversation_id = conversation.get("conversation_id")
+    counted = None
+    if conversation_id:
+        row = db.execute(
+            "SELECT message_count, participants FROM conversation_counts WHERE conversation_id = ?",
+            (conversation_id,)
+        ).fetchone()
+        if row:
+            counted = {"message_count": row[0], "participants": json.loads(row[1])}
+    
+    add_to_project_stats(stats, conversation, counted)
+    db.execute(
+        "INSERT OR REPLACE INTO project_stats VALUES (?, ?)",
+        (project_name, json.dumps(stats[project_name], ensure_ascii=False))
+    )
+    if conversation_id:
+        participants = set(conversation.get("participants", []))
+        if counted:
+            participants.update(counted["participants"])
+        db.execute(
+            "INSERT OR REPLACE INTO conversation_counts VALUES (?, ?, ?)",
+            (conversation_id, conversation.get("message_count", 0), json.dumps(sorted(participants)))
+        )
+
+def add_to_symbol_index(db: sqlite3.Connection, filename: str, conversation: Dict[str, Any]):
+    """Record the code blocks of a saved conversation and which symbols and files it touched"""
+    code_blocks = extract_code_blocks(conversation.get("messages", []))
+    db.executemany(
+        "INSERT OR REPLACE INTO code_blocks (file, position, language, code) VALUES (?, ?, ?, ?)",
+        [(filename, position, block["language"], block["code"]) for position, block in enumerate(code_blocks)]
+    )
+    entry = build_symbol_entry(conversation, code_blocks)
+    db.executemany(
+        "INSERT OR IGNORE INTO refs (name, kind, file) VALUES (?, ?, ?)",
+        [(name, kind, filename) for kind in ("symbols", "files") for name in entry[kind]]
+    )
+
+def add_to_index(db: sqlite3.Connection, filename: str, conversation: Dict[str, Any]):
+    """Apply a saved conversation to the stats and symbol tables; run inside one transaction"""
+    update_project_stats(db, conversation)
+    add_to_symbol_index(db, filename, conversation)
+    # The conversations row marks the file as indexed, and commits with the rest
+    db.execute(
+        "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?, ?)",
+        (
+            filename,
+            conversation.get("conversation_id"),
+            conversation.get("project_name", "Unknown Project"),
+            conversation.get("title"),
+            conversation.get("created_at")
+        )
+    )
+
+def update_vector_index(filename: str, conversation: Dict[str, Any]):
+    """Embed a newly saved conversation and append it to the vector index"""
+    vectors = vector_index.embed_texts([vector_index.conversation_text(conversation)])
+    metadata = [vector_index.conversation_metadata(filename, conversation)]
+    vector_index.append_vectors(VECTORS_PATH, VECTOR_METADATA_PATH, vectors, metadata)
+
+def reconcile_vector_index(batch_size: int = 1000) -> int:
+    """Embed, in batches, every saved conversation the vector index has no row for; returns how many"""
+    if os.path.exists(VECTORS_PATH) and os.path.exists(VECTOR_METADATA_PATH):
+        embedded = vector_index.indexed_files(VECTOR_METADATA_PATH)
+    else:
+        # Rows can't be matched to conversations without both files
+        for path in (VECTORS_PATH, VECTOR_METADATA_PATH):
+            if os.path.exists(path):
+                os.remove(path)
+        embedded = frozenset()
+    
+    count = 0
+    texts, metadata = [], []
+    for file, conversation in iter_saved_conversations(skip=embedded):
+        texts.append(vector_index.conversation_text(conversation))
+        metadata.append(vector_index.conversation_metadata(file, conversation))
+        count += 1
+        if len(texts) >= batch_size:
+            vector_index.append_vectors(VECTORS_PATH, VECTOR_METADATA_PATH, vector_index.embed_texts(texts), metadata)
+            texts, metadata = [], []
+    if texts:
+        vector_index.append_vectors(VECTORS_PATH, VECTOR_METADATA_PATH, vector_index.embed_texts(texts), metadata)
+    return count
+
+def apply_to_indexes(filename: str, conversation: Dict[str, Any]):
+    """
+    Apply a saved conversation to the on-disk indexes; callers must hold the index lock
+    
+    Each index records the files it includes together with its own update:
+    the database in the same transaction, the vector index in the metadata
+    line written after the vector. A failure in one is retried at the next
+    startup without applying the file to the other twice.
+    """
+    try:
+        db = open_index()
+        try:
+            with db:
+                add_to_index(db, filename, conversation)
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Error updating index: {e}", file=sys.stderr)
+    
+    if vector_index:
+        try:
+            update_vector_index(filename, conversation)
+        except Exception as e:
+            print(f"Error updating vector index: {e}", file=sys.stderr)
+
+def update_indexes(filename: str, conversation: Dict[str, Any]):
+    """Apply a saved conversation to every on-disk index while holding the index lock"""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with file_lock(INDEX_LOCK_PATH, _index_thread_lock):
+        apply_to_indexes(filename, conversation)
+
+def ensure_indexes():
+    """
+    Bring the indexes in line with the conversation files on disk
+    
+    Every file an index has no record of (saved by an older server, by a
+    process that stopped before indexing it, or all of them when the index
+    is missing) is applied to that index. Runs at startup, before saves are
+    accepted, so it never races with an incremental update; temp files of
+    commits that never completed are removed first.
+    """
+    ensure_logs_directory()
+    removed = remove_stale_temp_files("chat_logs", STALE_TEMP_SECONDS)
+    if removed:
+        print(f"🧹 Removed {removed} unfinished conversation temp files", file=sys.stderr)
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with file_lock(INDEX_LOCK_PATH, _index_thread_lock):
+        db = open_index()
+        try:
+            indexed = frozenset(row[0] for row in db.execute("SELECT file FROM conversations"))
+            missed = 0
+            for file, conversation in iter_saved_conversations(skip=indexed):
+                # One transaction per file, so a failure leaves it unapplied and unrecorded
+                try:
+                    with db:
+                        add_to_index(db, file, conversation)
+                    missed += 1
+                except Exception as e:
+                    print(f"Error indexing {file}: {e}", file=sys.stderr)
+        finally:
+            db.close()
+        if missed:
+            print(f"✅ Indexed {missed} conversations missing from the index", file=sys.stderr)
+        
+        if vector_index is None:
+            print("⚠️ NumPy is not installed: the vector index is not updated and similarity search is unavailable", file=sys.stderr)
+        else:
+            missed = reconcile_vector_index()
+            if missed:
+                print(f"✅ Embedded {missed} conversations missing from the vector index", file=sys.stderr)
+
+@asynccontextmanager
+async def conversation_lock(conversation_id: str):
+    """Hold the lock that orders saves of one conversation, freeing it after the last user"""
+    entry = _conversation_locks.get(conversation_id)
+    if entry is None:
+        entry = _conversation_locks[conversation_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _conversation_locks[conversation_id]
+
+async def write_conversation(messages: List[Dict[str, Any]], conversation_id: str = None,
+                             project_name: str = "MCP_Chat_Logger",
+                             analyze: Optional[Callable[[List[Dict[str, Any]]], Dict[str, str]]] = None) -> str:
+    """
+    Analyze a full conversation and write it to a JSON file, returning the filename
+    
+    analyze is the server's AI analysis function; pass None to skip analysis.
+    """
+    ensure_logs_directory()
+    
+    # Generate conversation ID if not provided
+    if not conversation_id:
+        conversation_id = str(uuid.uuid4())
+    
+    async with conversation_lock(conversation_id):
+        return await write_conversation_locked(messages, conversation_id, project_name, analyze)
+
+async def write_conversation_locked(messages: List[Dict[str, Any]], conversation_id: str, project_name: str,
+                                    analyze: Optional[Callable[[List[Dict[str, Any]]], Dict[str, str]]]) -> str:
+    """Body of write_conversation, run while holding the conversation's lock"""
+    # Use AI to analyze the entire conversation
+    if analyze:
+        print("🤖 Analyzing entire conversation with AI...", file=sys.stderr)
+        ai_analysis = await asyncio.to_thread(analyze, messages)
+        
+        title = ai_analysis.get("title", "Chat Conversation")
+        summary = ai_analysis.get("summary", "No summary available")
+        tag = ai_analysis.get("tag", "other")
+        description = ai_analysis.get("description", "No description available")
+        before_code = ai_analysis.get("before_code") or None
+        after_code = ai_analysis.get("after_code") or None
+        
+        print(f"✅ AI Analysis: {tag} - {description[:50]}...", file=sys.stderr)
+    else:
+        title = "Chat Conversation"
+        summary = "No summary available"
+        tag = "other"
+        description = "No description available"
+        before_code = None
+        after_code = None
+    
+    # Extract participants
+    participants = list(set(msg.get("role", "unknown") for msg in messages))
+    
+    # Convert messages to ChatMessage objects
+    chat_messages = []
+    for msg in messages:
+        chat_messages.append(ChatMessage(
+            role=msg.get("role", "unknown"),
+            content=msg.get("content", ""),
+            timestamp=msg.get("timestamp", datetime.now().isoformat())
+        ))
+    
+    # Create conversation summary
+    conversation = ConversationSummary(
+        conversation_id=conversation_id,
+        project_name=project_name,
+        tag=tag,
+        description=description,
+        before_code=before_code,
+        after_code=after_code,
+        title=title,
+        summary=summary,
+        message_count=len(messages),
+        participants=participants,
+        messages=chat_messages
+    )
+    
+    # Convert to dict and save as JSON
+    conversation_dict = conversation.model_dump()
+    conversation_dict['messages'] = [msg.model_dump() for msg in conversation.messages]
+    
+    # Commit atomically under a unique, monotonically increasing file name
+    filename = await committer.commit(
+        "chat_logs",
+        lambda stamp: f"conversation_{conversation_id}_{stamp}.json",
+        json.dumps(conversation_dict, indent=2, ensure_ascii=False)
+    )
+    
+    await asyncio.to_thread(update_indexes, os.path.basename(filename), conversation_dict)
+    
+    return filename
+
+async def write_markdown(messages: List[Dict[str, Any]], conversation_id: str = None) -> str:
+    """Write chat history as a Markdown file, returning the filename"""
+    ensure_logs_directory()
+    
+    # Format all messages
+    formatted_content = "# Chat History\n\n"
+    formatted_content += f"Conversation ID: {conversation_id}\n" if conversation_id else ""
+    formatted_content += f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+    
+    for message in messages:
+        formatted_content += format_message(message)
+    
+    # Save file atomically under a unique name
+    return await committer.commit(
+        "chat_logs",
+        lambda stamp: f"chat_{conversation_id}_{stamp}.md" if conversation_id else f"chat_{stamp}.md",
+        formatted_content
+    )
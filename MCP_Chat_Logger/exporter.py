@@ -0,0 +1,284 @@
+"""
+Export conversation history to columnar files for offline analytics
+
+Writes two tables, summaries and messages, partitioned as
+<output>/<table>/project=<name>/month=<YYYY-MM>/part-<run>-<n>.<ext>.
+Parquet and Arrow IPC need pyarrow; without it the export falls back to
+NDJSON. Each run only exports conversations saved since the previous run
+unless --full is given; an incremental run must use the format of the
+previous one.
+
+    python exporter.py --output exports --format parquet
+"""
+from typing import List, Dict, Any, Iterator, Tuple
+import os
+import sys
+import re
+import json
+import argparse
+from atomic_writer import next_file_stamp
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_FORMATS = ("parquet", "arrow", "ndjson")
+FILE_EXTENSIONS = {"parquet": "parquet", "arrow": "arrow", "ndjson": "ndjson"}
+STATE_FILENAME = "_export_state.json"
+
+# Files modified this close to the previous watermark are re-checked by name,
+# so a save that was committed slightly out of mtime order is not missed
+WATERMARK_MARGIN_NS = 60 * 1_000_000_000
+
+if pa:
+    SCHEMAS = {
+        "summaries": pa.schema([
+            ("conversation_id", pa.string()),
+            ("file", pa.string()),
+            ("project_name", pa.string()),
+            ("tag", pa.string()),
+            ("title", pa.string()),
+            ("description", pa.string()),
+            ("summary", pa.string()),
+            ("before_code", pa.string()),
+            ("after_code", pa.string()),
+            ("message_count", pa.int64()),
+            ("participants", pa.list_(pa.string())),
+            ("created_at", pa.string()),
+            ("updated_at", pa.string())
+        ]),
+        "messages": pa.schema([
+            ("conversation_id", pa.string()),
+            ("file", pa.string()),
+            ("project_name", pa.string()),
+            ("position", pa.int64()),
+            ("role", pa.string()),
+            ("content", pa.string()),
+            ("timestamp", pa.string())
+        ])
+    }
+
+def partition_value(value: str) -> str:
+    """Make a project name safe to use as a directory name"""
+    return re.sub(r'[^\w.-]+', '_', value or "unknown").strip("._") or "unknown"
+
+def month_of(conversation: Dict[str, Any]) -> str:
+    """Month partition (YYYY-MM) of a conversation, from its created_at"""
+    created_at = conversation.get("created_at") or ""
+    return created_at[:7] if re.match(r'\d{4}-\d{2}', created_at) else "unknown"
+
+def load_state(output_dir: str) -> Dict[str, Any]:
+    """Read the watermark left by the previous export run"""
+    try:
+        with open(os.path.join(output_dir, STATE_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"format": None, "watermark_ns": 0, "recent_files": {}}
+
+def save_state(output_dir: str, state: Dict[str, Any]):
+    """Atomically record the watermark for the next incremental run"""
+    path = os.path.join(output_dir, STATE_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def iter_new_conversations(logs_dir: str, state: Dict[str, Any]) -> Iterator[Tuple[str, int, Dict[str, Any]]]:
+    """Yield (filename, mtime_ns, data) for conversations not exported yet, one file at a time"""
+    since_ns = state["watermark_ns"] - WATERMARK_MARGIN_NS
+    already_exported = set(state["recent_files"])
+    candidates = []
+    for entry in os.scandir(logs_dir):
+        if not entry.name.endswith(".json") or not entry.is_file():
+            continue
+        mtime_ns = entry.stat().st_mtime_ns
+        if mtime_ns >= since_ns and entry.name not in already_exported:
+            candidates.append((mtime_ns, entry.name))
+
+    for mtime_ns, name in sorted(candidates):
+        try:
+            with open(os.path.join(logs_dir, name), "r", encoding="utf-8") as f:
+                yield name, mtime_ns, json.load(f)
+        except Exception as e:
+            print(f"Error reading file {name}: {e}", file=sys.stderr)
+
+def summary_row(filename: str, conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a conversation into a row of the summaries table"""
+    return {
+        "conversation_id": conversation.get("conversation_id"),
+        "file": filename,
+        "project_name": conversation.get("project_name"),
+        "tag": conversation.get("tag"),
+        "title": conversation.get("title"),
+        "description": conversation.get("description"),
+        "summary": conversation.get("summary"),
+        "before_code": conversation.get("before_code"),
+        "after_code": conversation.get("after_code"),
+        "message_count": conversation.get("message_count", 0),
+        "participants": conversation.get("participants", []),
+        "created_at": conversation.get("created_at"),
+        "updated_at": conversation.get("updated_at")
+    }
+
+def message_rows(filename: str, conversation: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten a conversation's messages into rows of the messages table"""
+    return [
+        {
+            "conversation_id": conversation.get("conversation_id"),
+            "file": filename,
+            "project_name": conversation.get("project_name"),
+            "position": position,
+            "role": msg.get("role"),
+            "content": msg.get("content"),
+            "timestamp": msg.get("timestamp")
+        }
+        for position, msg in enumerate(conversation.get("messages", []))
+    ]
+
+def write_part(path: str, table_name: str, rows: List[Dict[str, Any]], export_format: str):
+    """Write one partition file of rows in the requested format"""
+    if export_format == "ndjson":
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        return
+
+    table = pa.Table.from_pylist(rows, schema=SCHEMAS[table_name])
+    if export_format == "parquet":
+        pq.write_table(table, path, compression="zstd")
+    else:
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+class PartitionedWriter:
+    """
+    Buffers rows per (table, project, month) and flushes them as part files once the batch is full
+
+    A full batch only flushes its largest partitions, down to half the batch;
+    small partitions keep accumulating until commit, so they end up in one
+    part file instead of one per flush.
+    """
+
+    def __init__(self, output_dir: str, export_format: str, batch_rows: int):
+        self.output_dir = output_dir
+        self.export_format = export_format
+        self.batch_rows = batch_rows
+        self.run_stamp = next_file_stamp()
+        self.buffers: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        self.buffered_rows = 0
+        self.part_number = 0
+        self.written: List[Tuple[str, str]] = []  # (temp path, final path)
+        self.row_counts = {"summaries": 0, "messages": 0}
+
+    def add(self, table_name: str, project: str, month: str, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        self.buffers.setdefault((table_name, project, month), []).extend(rows)
+        self.buffered_rows += len(rows)
+        self.row_counts[table_name] += len(rows)
+        if self.buffered_rows >= self.batch_rows:
+            self.flush(self.batch_rows // 2)
+
+    def flush(self, keep_rows: int = 0):
+        """Write the largest buffered partitions to part files until at most keep_rows rows stay buffered"""
+        extension = FILE_EXTENSIONS[self.export_format]
+        for key in sorted(self.buffers, key=lambda key: len(self.buffers[key]), reverse=True):
+            if self.buffered_rows <= keep_rows:
+                break
+            table_name, project, month = key
+            rows = self.buffers.pop(key)
+            directory = os.path.join(self.output_dir, table_name, f"project={project}", f"month={month}")
+            os.makedirs(directory, exist_ok=True)
+            self.part_number += 1
+            final_path = os.path.join(directory, f"part-{self.run_stamp}-{self.part_number:05d}.{extension}")
+            # Hidden until the run completes so readers never pick up half an export
+            tmp_path = os.path.join(directory, f".part-{self.run_stamp}-{self.part_number:05d}.tmp")
+            write_part(tmp_path, table_name, rows, self.export_format)
+            self.written.append((tmp_path, final_path))
+            self.buffered_rows -= len(rows)
+
+    def commit(self, replace_existing: bool = False):
+        """Publish all part files written during this run, optionally dropping earlier runs' parts"""
+        self.flush()
+        if replace_existing:
+            for table_name in ("summaries", "messages"):
+                for root, _, files in os.walk(os.path.join(self.output_dir, table_name)):
+                    for name in files:
+                        if name.startswith("part-"):
+                            os.remove(os.path.join(root, name))
+        for tmp_path, final_path in self.written:
+            os.replace(tmp_path, final_path)
+
+def export_history(logs_dir: str = "chat_logs", output_dir: str = "exports", export_format: str = "parquet",
+                   full: bool = False, batch_rows: int = 5000) -> Dict[str, Any]:
+    """
+    Stream saved conversations into partitioned summaries/messages tables
+
+    Memory is bounded by batch_rows: the largest buffered partitions are
+    flushed to part files whenever the batch fills up. Raises ValueError when
+    an incremental run asks for a different format than the existing export.
+    Returns the format used and the number of
+    conversations and rows exported.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    if export_format != "ndjson" and pa is None:
+        print(f"⚠️ pyarrow is not installed, exporting NDJSON instead of {export_format}", file=sys.stderr)
+        export_format = "ndjson"
+
+    os.makedirs(output_dir, exist_ok=True)
+    state = {"format": None, "watermark_ns": 0, "recent_files": {}} if full else load_state(output_dir)
+    if state.get("format") not in (None, export_format):
+        # Appending parts in another format would leave a mixed, unreadable dataset
+        raise ValueError(f"{output_dir} holds a {state['format']} export; "
+                         f"export {state['format']} again or run a full export to switch to {export_format}")
+    writer = PartitionedWriter(output_dir, export_format, batch_rows)
+
+    conversations = 0
+    recent_files = dict(state["recent_files"])
+    for filename, mtime_ns, conversation in iter_new_conversations(logs_dir, state):
+        project = partition_value(conversation.get("project_name"))
+        month = month_of(conversation)
+        writer.add("summaries", project, month, [summary_row(filename, conversation)])
+        writer.add("messages", project, month, message_rows(filename, conversation))
+        conversations += 1
+        recent_files[filename] = mtime_ns
+    writer.commit(replace_existing=full)
+
+    # Remember files near the new watermark so the next run can skip them by name
+    watermark_ns = max([state["watermark_ns"]] + list(recent_files.values()))
+    recent_files = {
+        name: mtime_ns for name, mtime_ns in recent_files.items()
+        if mtime_ns >= watermark_ns - WATERMARK_MARGIN_NS
+    }
+    save_state(output_dir, {"format": export_format, "watermark_ns": watermark_ns, "recent_files": recent_files})
+
+    return {
+        "format": export_format,
+        "conversations": conversations,
+        "summaries": writer.row_counts["summaries"],
+        "messages": writer.row_counts["messages"]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Export chat history to partitioned columnar files")
+    parser.add_argument("--logs", default="chat_logs", help="Directory of saved conversations")
+    parser.add_argument("--output", default="exports", help="Directory to write the export to")
+    parser.add_argument("--format", default="parquet", choices=EXPORT_FORMATS)
+    parser.add_argument("--full", action="store_true", help="Export everything, not just conversations since the last run")
+    parser.add_argument("--batch-rows", type=int, default=5000, help="Rows buffered before part files are written")
+    args = parser.parse_args()
+
+    try:
+        result = export_history(args.logs, args.output, args.format, args.full, args.batch_rows)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"✅ Exported {result['conversations']} conversations "
+          f"({result['summaries']} summaries, {result['messages']} messages) as {result['format']} to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Incremental conversation journals shared by both MCP servers
+
+New turns are appended to a per-conversation journal without resending the
+history. Finalizing analyzes the whole session once and saves it through
+conversation_store; idle conversations are finalized automatically, and
+journals a previous run left open or failed to finalize are picked up when
+a server starts.
+"""
+from typing import List, Dict, Any, Optional, Callable
+import os
+import sys
+import json
+import asyncio
+import uuid
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime
+import conversation_store
+from conversation_store import ChatMessage, conversation_lock, ensure_logs_directory, latest_saved_conversation
+
+# Open journals are fsynced every N messages and finalized automatically
+# after the conversation has been idle
+JOURNAL_DIR = os.path.join("chat_logs", "journals")
+JOURNAL_FSYNC_BATCH = int(os.getenv("CHAT_LOGGER_FSYNC_BATCH", "8"))
+FINALIZE_DEBOUNCE_SECONDS = float(os.getenv("CHAT_LOGGER_FINALIZE_DEBOUNCE", "300"))
+
+# A journal moved aside by finalize: <conversation_id>.jsonl.<uuid hex>.finalizing
+FINALIZING_PATTERN = re.compile(r"(.+)\.jsonl\.[0-9a-f]{32}\.finalizing")
+
+# conversation_id -> {"handle": open journal file, "pending": unsynced count}
+_journals: Dict[str, Dict[str, Any]] = {}
+
+# conversation_id -> debounce timer that finalizes the conversation
+_finalize_timers: Dict[str, asyncio.TimerHandle] = {}
+
+# Finalize tasks started by timers; the loop only keeps weak references to tasks
+_finalize_tasks: set = set()
+
+def journal_path(conversation_id: str) -> str:
+    """Path of the append-only journal for an open conversation"""
+    return os.path.join(JOURNAL_DIR, f"{conversation_id}.jsonl")
+
+def open_journal(conversation_id: str, project_name: str, use_ai_analysis: bool) -> Dict[str, Any]:
+    """Return the in-memory state for a conversation journal, creating the file if needed"""
+    state = _journals.get(conversation_id)
+    if state:
+        return state
+    
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    path = journal_path(conversation_id)
+    is_new = not os.path.exists(path)
+    handle = open(path, "a", encoding="utf-8")
+    if is_new:
+        # First line records the save options so finalize works after a restart
+        meta = {"_meta": {"project_name": project_name, "use_ai_analysis": use_ai_analysis}}
+        handle.write(json.dumps(meta, ensure_ascii=False) + "\n")
+    
+    state = {"handle": handle, "pending": 0}
+    _journals[conversation_id] = state
+    return state
+
+def close_journal(conversation_id: str):
+    """Flush, fsync and close the journal handle"""
+    state = _journals.pop(conversation_id, None)
+    if not state:
+        return
+    handle = state["handle"]
+    handle.flush()
+    os.fsync(handle.fileno())
+    handle.close()
+
+def read_journal(path: str):
+    """Read the save options and messages recorded in a conversation journal"""
+    meta = {}
+    messages = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from a crash; everything before it is intact
+                print(f"⚠️ Skipping unreadable journal line in {path}", file=sys.stderr)
+                continue
+            if "_meta" in record:
+                meta = record["_meta"]
+            else:
+                messages.append(record)
+    return meta, messages
+
+def finalizing_paths(conversation_id: str) -> List[str]:
+    """Journals of a conversation moved aside by finalize and not saved yet, oldest first"""
+    if not os.path.isdir(JOURNAL_DIR):
+        return []
+    paths = []
+    for name in os.listdir(JOURNAL_DIR):
+        match = FINALIZING_PATTERN.fullmatch(name)
+        if match and match.group(1) == conversation_id:
+            paths.append(os.path.join(JOURNAL_DIR, name))
+    return sorted(paths, key=os.path.getmtime)
+
+def schedule_finalize(conversation_id: str, analyze: Optional[Callable[[List[Dict[str, Any]]], Dict[str, str]]],
+                      delay: float = None):
+    """(Re)start the timer that finalizes a conversation, by default once it has been idle"""
+    if delay is None:
+        if FINALIZE_DEBOUNCE_SECONDS <= 0:
+            return
+        delay = FINALIZE_DEBOUNCE_SECONDS
+    timer = _finalize_timers.pop(conversation_id, None)
+    if timer:
+        timer.cancel()
+    loop = asyncio.get_running_loop()
+    _finalize_timers[conversation_id] = loop.call_later(delay, start_finalize, conversation_id, analyze)
+
+def start_finalize(conversation_id: str, analyze: Optional[Callable[[List[Dict[str, Any]]], Dict[str, str]]]):
+    """Run a timed finalize as a task that is kept alive until it is done"""
+    task = asyncio.ensure_future(finalize(conversation_id, analyze))
+    _finalize_tasks.add(task)
+    task.add_done_callback(lambda done: finalize_done(conversation_id, done))
+
+def finalize_done(conversation_id: str, task: asyncio.Task):
+    """Drop a finished finalize task and report why it failed, if it did"""
+    _finalize_tasks.discard(task)
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error:
+        print(f"❌ Finalizing conversation {conversation_id} failed: {error}", file=sys.stderr)
+
+async def append_messages(conversation_id: str, messages: List[Dict[str, Any]], project_name: str,
+                          use_ai_analysis: bool,
+                          analyze: Optional[Callable[[List[Dict[str, Any]]], Dict[str, str]]]) -> str:
+    """
+    Append new messages to a conversation's journal and restart its idle timer
+    
+    analyze is the server's AI analysis function, used on finalize when the
+    journal was opened with use_ai_analysis.
+    """
+    ensure_logs_directory()
+    state = open_journal(conversation_id, project_name, use_ai_analysis)
+    handle = state["handle"]
+    
+    for msg in messages:
+        chat_message = ChatMessage(
+            role=msg.get("role", "unknown"),
+            content=msg.get("content", ""),
+            timestamp=msg.get("timestamp", datetime.now().isoformat())
+        )
+        handle.write(json.dumps(chat_message.model_dump(), ensure_ascii=False) + "\n")
+    handle.flush()
+    
+    # Batch fsyncs so a chatty session does not pay one disk sync per message
+    state["pending"] += len(messages)
+    if state["pending"] >= JOURNAL_FSYNC_BATCH:
+        os.fsync(handle.fileno())
+        state["pending"] = 0
+    
+    schedule_finalize(conversation_id, analyze)
+    return f"✅ Appended {len(messages)} message(s) to conversation {conversation_id}"
+
+async def finalize(conversation_id: str,
+                   analyze: Optional[Callable[[List[Dict[str, Any]]], Dict[str, str]]]) -> str:
+    """
+    Analyze a conversation's journal and save the whole session as a JSON conversation file
+    
+    The saved file holds the messages of the conversation's previous saved
+    file followed by those appended since.
+    """
+    timer = _finalize_timers.pop(conversation_id, None)
+    if timer:
+        timer.cancel()
+    
+    async with conversation_lock(conversation_id):
+        close_journal(conversation_id)
+        path = journal_path(conversation_id)
+        if os.path.exists(path):
+            # Move the journal aside so messages appended during analysis start a new one
+            os.replace(path, f"{path}.{uuid.uuid4().hex}.finalizing")
+        
+        # Also retry journals of earlier finalizes that failed before saving;
+        # they are only removed once a save containing them succeeded
+        pending_paths = finalizing_paths(conversation_id)
+        if not pending_paths:
+            return f"❌ No open conversation found for {conversation_id}"
+        meta, messages = {}, []
+        for pending_path in pending_paths:
+            journal_meta, journal_messages = read_journal(pending_path)
+            meta = meta or journal_meta
+            messages += journal_messages
+        
+        # The journals only hold messages since the last finalize; every saved
+        # file holds the whole session, so continue from the newest one
+        previous = latest_saved_conversation(conversation_id)
+        previous_messages = previous.get("messages", []) if previous else []
+        if messages and previous_messages[-len(messages):] == messages:
+            # Saved by a finalize that stopped before removing its journals
+            filename = None
+        else:
+            filename = await conversation_store.write_conversation_locked(
+                previous_messages + messages,
+                conversation_id,
+                meta.get("project_name", "MCP_Chat_Logger"),
+                analyze if meta.get("use_ai_analysis", True) else None
+            )
+        for pending_path in pending_paths:
+            os.remove(pending_path)
+    
+    if filename is None:
+        return f"✅ Conversation {conversation_id} was already finalized"
+    return f"✅ Conversation finalized to JSON file: {filename}"
+
+def recovery_lifespan(analyze: Optional[Callable[[List[Dict[str, Any]]], Dict[str, str]]]):
+    """Return a FastMCP lifespan that picks up journals a previous run left open or failed to finalize"""
+    @asynccontextmanager
+    async def recover_journals(server):
+        if os.path.isdir(JOURNAL_DIR):
+            for name in os.listdir(JOURNAL_DIR):
+                match = FINALIZING_PATTERN.fullmatch(name)
+                if match:
+                    # A finalize was requested but never saved; retry it right away
+                    schedule_finalize(match.group(1), analyze, delay=0)
+                elif name.endswith(".jsonl") and name[:-len(".jsonl")] not in _finalize_timers:
+                    schedule_finalize(name[:-len(".jsonl")], analyze)
+        yield {}
+    return recover_journals
@@ -0,0 +1,191 @@
+from typing import List, Dict, Any, Tuple
+import os
+import re
+import hashlib
+
+# tiktoken gives exact counts for OpenAI-style tokenizers; without it we fall
+# back to a word/punctuation split, which tracks BPE counts closely enough
+# for budgeting
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+# Maximum tokens of conversation text sent to the LLM per save
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+
+# Outputs longer than this many lines keep only their head and tail
+LONG_OUTPUT_LINES = int(os.getenv("PROMPT_LONG_OUTPUT_LINES", "40"))
+OUTPUT_HEAD_LINES = 15
+OUTPUT_TAIL_LINES = 10
+
+# Fenced blocks with these language hints are program output, not code
+OUTPUT_LANGUAGES = {"text", "txt", "log", "logs", "console", "output", "stdout", "stderr", "shell-session"}
+
+CODE_FENCE_PATTERN = re.compile(r'```([\w+#-]*)[^\n]*\n(.*?)```', re.DOTALL)
+PYTHON_TRACEBACK_PATTERN = re.compile(
+    r'Traceback \(most recent call last\):\n(?:[ \t]+.*\n)+?(?=\S)',
+)
+# How the unreduced prompt picked the code blocks it listed, for tokens_before
+LEGACY_CODE_BLOCK_PATTERN = re.compile(
+    r'```(?:python|py|javascript|js|typescript|ts|java|cpp|c|html|css|sql|bash|sh)?\n(.*?)```', re.DOTALL
+)
+STACK_FRAME_RUN_PATTERN = re.compile(r'(?:^[ \t]+at .*\n?){6,}', re.MULTILINE)
+
+# A line that starts like a log record: a timestamp or a log level
+LOG_LINE_PATTERN = r'[ \t]*(?:\[?\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}|\[?\d{2}:\d{2}:\d{2}|\[?(?:TRACE|DEBUG|INFO|WARN|WARNING|ERROR|FATAL|CRITICAL)\b)'
+LOG_RUN_PATTERN = re.compile(rf'(?:^{LOG_LINE_PATTERN}.*(?:\n|$)){{{LONG_OUTPUT_LINES + 1},}}', re.MULTILINE)
+
+def count_tokens(text: str) -> int:
+    """Count tokens with the local tokenizer"""
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(re.findall(r'\w+|[^\w\s]', text))
+
+def collapse_long_output(text: str) -> str:
+    """Keep only the head and tail of long output"""
+    lines = text.split("\n")
+    if len(lines) <= LONG_OUTPUT_LINES:
+        return text
+    omitted = len(lines) - OUTPUT_HEAD_LINES - OUTPUT_TAIL_LINES
+    return "\n".join(
+        lines[:OUTPUT_HEAD_LINES]
+        + [f"... [{omitted} lines omitted] ..."]
+        + lines[-OUTPUT_TAIL_LINES:]
+    )
+
+def collapse_stack_traces(text: str) -> str:
+    """Shorten Python tracebacks and JS/Java 'at ...' frame runs to their last frames"""
+    def collapse_traceback(match):
+        frames = match.group(0).split("\n")[1:-1]
+        if len(frames) <= 4:
+            return match.group(0)
+        # Each Python frame is a "File ..." line plus its source line
+        return (
+            "Traceback (most recent call last):\n"
+            f"  ... [{len(frames) - 4} traceback lines omitted] ...\n"
+            + "\n".join(frames[-4:]) + "\n"
+        )
+
+    def collapse_frames(match):
+        frames = match.group(0).rstrip("\n").split("\n")
+        return "\n".join(
+            frames[:2]
+            + [f"    ... [{len(frames) - 4} frames omitted] ..."]
+            + frames[-2:]
+        ) + "\n"
+
+    text = PYTHON_TRACEBACK_PATTERN.sub(collapse_traceback, text)
+    return STACK_FRAME_RUN_PATTERN.sub(collapse_frames, text)
+
+def collapse_log_runs(text: str) -> str:
+    """Keep only the head and tail of long runs of log lines pasted into prose"""
+    def collapse_run(match):
+        run = match.group(0)
+        ending = "\n" if run.endswith("\n") else ""
+        return collapse_long_output(run[:len(run) - len(ending)]) + ending
+    return LOG_RUN_PATTERN.sub(collapse_run, text)
+
+def reduce_prose(text: str) -> str:
+    """Collapse traces and log runs in prose; ordinary text is left to the token budget"""
+    return collapse_log_runs(collapse_stack_traces(text))
+
+def reduce_message_content(content: str, message_number: int, seen_blocks: Dict[str, int]) -> str:
+    """Dedupe code blocks and collapse traces and long outputs within one message"""
+    def reduce_block(match):
+        language, code = match.group(1), match.group(2)
+        digest = hashlib.sha1(code.strip().encode("utf-8")).hexdigest()
+        if digest in seen_blocks:
+            return f"```\n[same code block as message {seen_blocks[digest]}]\n```"
+        seen_blocks[digest] = message_number
+        if language.lower() in OUTPUT_LANGUAGES:
+            code = collapse_long_output(collapse_stack_traces(code))
+        return f"```{language}\n{code}```"
+
+    parts = []
+    last_end = 0
+    for match in CODE_FENCE_PATTERN.finditer(content):
+        # Prose between code blocks can hold pasted logs too
+        parts.append(reduce_prose(content[last_end:match.start()]))
+        parts.append(reduce_block(match))
+        last_end = match.end()
+    parts.append(reduce_prose(content[last_end:]))
+    return "".join(parts)
+
+def legacy_code_listing(messages: List[Dict[str, Any]]) -> str:
+    """The code-block listing the unreduced prompt repeated after the conversation"""
+    code_blocks = []
+    for msg in messages:
+        content = msg.get("content", "")
+        for code_block in LEGACY_CODE_BLOCK_PATTERN.findall(content):
+            if len(code_block.strip()) > 50:
+                code_blocks.append(code_block.strip())
+    return "Code blocks found in conversation:\n" + "\n".join(
+        f"```{i+1}: {code[:200]}...```" for i, code in enumerate(code_blocks)
+    )
+
+def truncate_to_budget(text: str, budget: int) -> str:
+    """Cut a single oversized text down to roughly budget tokens, keeping both ends"""
+    tokens = count_tokens(text)
+    if tokens <= budget:
+        return text
+    keep_chars = max(int(len(text) * budget / tokens) - 40, 0)
+    head = keep_chars * 2 // 3
+    tail = keep_chars - head
+    return text[:head] + "\n... [truncated to fit token budget] ...\n" + (text[-tail:] if tail else "")
+
+def reduce_conversation(messages: List[Dict[str, Any]], token_budget: int = None) -> Tuple[str, Dict[str, int]]:
+    """
+    Build the conversation text for the analysis prompt within a token budget
+
+    Repeated code blocks and repeated messages are replaced by references,
+    stack traces and long outputs are collapsed, and if the result is still
+    over budget the oldest messages after the first one are dropped.
+
+    Returns the conversation text and a dict with tokens_before/tokens_after.
+    tokens_before counts what the unreduced prompt sent: the raw
+    conversation plus its listing of every code block.
+    """
+    if token_budget is None:
+        token_budget = PROMPT_TOKEN_BUDGET
+
+    raw_text = ""
+    seen_blocks = {}
+    seen_messages = {}
+    entries = []
+    for number, msg in enumerate(messages, 1):
+        role = msg.get("role", "unknown")
+        content = msg.get("content", "")
+        raw_text += f"{role.upper()}: {content}\n\n"
+
+        digest = hashlib.sha1(content.strip().encode("utf-8")).hexdigest()
+        if digest in seen_messages and len(content) > 200:
+            content = f"[same content as message {seen_messages[digest]}]"
+        else:
+            seen_messages.setdefault(digest, number)
+            content = reduce_message_content(content, number, seen_blocks)
+        entries.append(f"{role.upper()}: {content}\n\n")
+
+    # Keep the opening request and as many of the latest messages as fit
+    counts = [count_tokens(entry) for entry in entries]
+    if sum(counts) > token_budget and entries:
+        first = truncate_to_budget(entries[0], token_budget // 2)
+        remaining = token_budget - count_tokens(first)
+        kept = []
+        for entry, tokens in zip(reversed(entries[1:]), reversed(counts[1:])):
+            if tokens > remaining:
+                if not kept:
+                    kept.append(truncate_to_budget(entry, remaining))
+                break
+            kept.append(entry)
+            remaining -= tokens
+        omitted = len(entries) - 1 - len(kept)
+        marker = [f"[{omitted} messages omitted]\n\n"] if omitted else []
+        entries = [first] + marker + list(reversed(kept))
+
+    conversation_text = "".join(entries)
+    return conversation_text, {
+        "tokens_before": count_tokens(raw_text + "\n" + legacy_code_listing(messages)),
+        "tokens_after": count_tokens(conversation_text)
+    }
@@ -0,0 +1,159 @@
+from typing import List, Dict, Any, Tuple
+import os
+import re
+import json
+import zlib
+import numpy as np
+
+# Hashed n-gram embeddings: no model download, stable across processes, and
+# cheap enough to compute on every save. The dashboard imports this module
+# for query embedding, so both sides always hash the same way.
+VECTOR_DIM = 256
+CHAR_NGRAM = 3
+MAX_EMBED_CHARS = 8000
+
+# Defaults written when AI analysis is off; they would make every such
+# conversation look alike
+PLACEHOLDER_TEXTS = {"Chat Conversation", "No summary available", "No description available"}
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens, also splitting snake_case and camelCase"""
+    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+def hashed_features(text: str) -> List[int]:
+    """Return the hashes of the word unigrams, word bigrams and character trigrams of text"""
+    words = tokenize(text[:MAX_EMBED_CHARS])
+    features = list(words)
+    features += [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features += [padded[i:i + CHAR_NGRAM] for i in range(len(padded) - CHAR_NGRAM + 1)]
+    return [zlib.crc32(feature.encode("utf-8")) for feature in features]
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """Embed a batch of texts as L2-normalized float32 rows of a (len(texts), VECTOR_DIM) matrix"""
+    rows, hashes = [], []
+    for row, text in enumerate(texts):
+        feature_hashes = hashed_features(text)
+        rows.extend([row] * len(feature_hashes))
+        hashes.extend(feature_hashes)
+
+    vectors = np.zeros((len(texts), VECTOR_DIM), dtype=np.float32)
+    if hashes:
+        hashes = np.array(hashes, dtype=np.uint32)
+        # Low bits pick the dimension, one high bit picks the sign
+        columns = (hashes % VECTOR_DIM).astype(np.intp)
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vectors, (np.array(rows, dtype=np.intp), columns), signs)
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def conversation_text(conversation: Dict[str, Any]) -> str:
+    """Text that represents a conversation for similarity: summary fields, code and opening messages"""
+    parts = [
+        conversation.get("title") or "",
+        conversation.get("description") or "",
+        conversation.get("summary") or "",
+        conversation.get("before_code") or "",
+        conversation.get("after_code") or ""
+    ]
+    messages = conversation.get("messages", [])
+    parts += [msg.get("content", "") for msg in messages[:4]]
+    return "\n".join(part for part in parts if part and part not in PLACEHOLDER_TEXTS)
+
+def conversation_metadata(filename: str, conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadata row stored next to a conversation's vector"""
+    return {
+        "file": filename,
+        "conversation_id": conversation.get("conversation_id"),
+        "project_name": conversation.get("project_name", "Unknown Project"),
+        "title": conversation.get("title"),
+        "created_at": conversation.get("created_at")
+    }
+
+def append_vectors(vectors_path: str, metadata_path: str, vectors: np.ndarray, metadata: List[Dict[str, Any]]):
+    """
+    Append vector rows and their metadata; callers must hold the index lock
+
+    Each metadata row records the vector row it describes, so a crash
+    between the two appends leaves an orphan vector instead of shifting
+    every later conversation onto its neighbour's vector.
+    """
+    row_bytes = VECTOR_DIM * 4
+    with open(vectors_path, "ab") as f:
+        size = f.tell()
+        if size % row_bytes:
+            # Drop a row cut short by a crash
+            size -= size % row_bytes
+            f.truncate(size)
+        f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+    first_row = size // row_bytes
+
+    with open(metadata_path, "ab+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # End a line cut short by a crash so it can't swallow the next one
+                f.write(b"\n")
+        lines = [json.dumps(dict(row, row=first_row + offset), ensure_ascii=False) + "\n" for offset, row in enumerate(metadata)]
+        f.write("".join(lines).encode("utf-8"))
+
+def read_metadata(metadata_path: str, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Read the complete metadata lines from byte offset on
+
+    Returns them and the offset just past the last complete line, so a
+    reader can pick up later appends without re-reading the file. Lines cut
+    short by a crash are skipped.
+    """
+    entries = []
+    with open(metadata_path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # Still being appended; read it next time
+                break
+            offset += len(line)
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries, offset
+
+def indexed_files(metadata_path: str) -> frozenset:
+    """Names of the conversation files that have a vector row"""
+    return frozenset(info["file"] for info in read_metadata(metadata_path)[0])
+
+def map_vectors(vectors_path: str) -> np.ndarray:
+    """Memory-map every complete row of the vector file"""
+    rows = os.path.getsize(vectors_path) // (VECTOR_DIM * 4)
+    if rows == 0:
+        return np.zeros((0, VECTOR_DIM), dtype=np.float32)
+    return np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, VECTOR_DIM))
+
+def search(vectors: np.ndarray, query: np.ndarray, k: int = 10, chunk_rows: int = 65536) -> List[Tuple[int, float]]:
+    """
+    Return (row, cosine score) pairs for the k rows most similar to query
+
+    Rows are scanned in chunks so only a slice of the memory-mapped file is
+    touched at a time; 100k rows of 256 floats score in ~20ms on one core.
+    """
+    if len(vectors) == 0 or k <= 0:
+        return []
+    best_rows = np.empty(0, dtype=np.intp)
+    best_scores = np.empty(0, dtype=np.float32)
+    for start in range(0, len(vectors), chunk_rows):
+        scores = np.asarray(vectors[start:start + chunk_rows]) @ query
+        take = min(k, len(scores))
+        top = np.argpartition(-scores, take - 1)[:take]
+        best_rows = np.concatenate([best_rows, top + start])
+        best_scores = np.concatenate([best_scores, scores[top]])
+        if len(best_rows) > k:
+            keep = np.argpartition(-best_scores, k - 1)[:k]
+            best_rows, best_scores = best_rows[keep], best_scores[keep]
+    order = np.argsort(-best_scores)
+    return [(int(best_rows[i]), float(best_scores[i])) for i in order]
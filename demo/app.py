@@ -1,13 +1,51 @@
-from flask import Flask, jsonify, render_template
+from flask import Flask, jsonify, render_template, request
 from flask_cors import CORS
+import hashlib
 import json
 import os
 import re
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows: the dev server runs a single process anyway
+    fcntl = None
+
+LOGGER_DIR = os.path.join(os.path.dirname(__file__), '..', 'MCP_Chat_Logger')
+
+# Query embedding must match the logger's, so reuse its vector_index module;
+# similarity search is unavailable without NumPy
+sys.path.insert(0, LOGGER_DIR)
+try:
+    import numpy as np
+    import vector_index
+except ImportError:
+    vector_index = None
+
 app = Flask(__name__)
 CORS(app)
 
+CHAT_LOGS_DIR = os.path.join(LOGGER_DIR, 'chat_logs')
+INDEX_DB_PATH = os.path.join(CHAT_LOGS_DIR, 'index', 'index.sqlite')
+VECTORS_PATH = os.path.join(CHAT_LOGS_DIR, 'index', 'vectors.f32')
+VECTOR_METADATA_PATH = os.path.join(CHAT_LOGS_DIR, 'index', 'vectors.jsonl')
+
+# Shared catalog of built project data, reused by every worker process
+CATALOG_PATH = os.path.join(CHAT_LOGS_DIR, 'index', 'catalog.json')
+CATALOG_LOCK_PATH = os.path.join(CHAT_LOGS_DIR, 'index', 'catalog.lock')
+_catalog = {}
+
+# Memory-mapped vector index and its parsed metadata, extended as the logger appends
+_vectors = {}
+
+# Project stats responses, valid until the logger writes to the index again
+_project_stats = {'signature': None, 'projects': {}}
+
 def get_type_from_tag(tag):
     """Convert tag to type"""
     tag_map = {
@@ -211,90 +249,502 @@ def index():
     """Home page"""
     return render_template('index.html')
 
+class ConversationCache:
+    """
+    LRU cache of derived conversation summaries, bounded by total bytes
+    
+    Entries are keyed by (path, mtime, size), so a rewritten file simply
+    misses and its stale entry ages out of the LRU.
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict()  # key -> (value, size in bytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                self.current_bytes -= self.entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'maxBytes': self.max_bytes
+            }
+
+conversation_cache = ConversationCache(int(os.getenv('DASHBOARD_CACHE_MAX_BYTES', str(64 * 1024 * 1024))))
+
+def summarize_conversation(data):
+    """Build the dashboard summary for one parsed conversation file"""
+    # Extract project information
+    project_name = data.get('project_name', 'Unknown Project')
+    tag = data.get('tag', 'other')
+    description = data.get('description', '')
+    before_code = data.get('before_code', '')
+    after_code = data.get('after_code', '')
+    summary = data.get('summary', description)
+    timestamp = data.get('created_at', datetime.now().isoformat())
+    message_count = data.get('message_count', 0)
+    participants = data.get('participants', [])
+    
+    # Create project summary object; id and title fall back to the file's
+    # position in the listing, which is filled in by build_project_data
+    project_summary = {
+        'projectName': project_name,
+        'summary': summary,
+        'type': get_type_from_tag(tag),
+        'timestamp': timestamp,
+        'aiModel': 'Openai',
+        'functions': extract_functions(data),
+        'bugFixes': extract_bug_fixes(data),
+        'tags': extract_tags(data),
+        'codeChanges': format_code_changes(before_code, after_code),
+        'impact': generate_impact_description(tag, description),
+        'messageCount': message_count,
+        'participants': participants
+    }
+    if 'conversation_id' in data:
+        project_summary['id'] = data['conversation_id']
+    if 'title' in data:
+        project_summary['title'] = data['title']
+    
+    return project_summary
+
+def load_conversation_summary(file_path, file_stat):
+    """Return the summary for a conversation file, parsing it only on a cache miss"""
+    key = (file_path, file_stat.st_mtime_ns, file_stat.st_size)
+    project_summary = conversation_cache.get(key)
+    if project_summary is None:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        project_summary = summarize_conversation(data)
+        size = len(json.dumps(project_summary, ensure_ascii=False).encode('utf-8'))
+        conversation_cache.put(key, project_summary, size)
+    return project_summary
+
+def scan_conversation_files(chat_logs_dir):
+    """Return (name, stat) for every conversation file; the stat doubles as the cache key"""
+    files = []
+    for entry in os.scandir(chat_logs_dir):
+        if entry.name.endswith('.json') and entry.is_file():
+            files.append((entry.name, entry.stat()))
+    return files
+
+def source_signature(files):
+    """Fingerprint of the conversation files' names, mtimes and sizes"""
+    digest = hashlib.sha1()
+    for name, file_stat in sorted(files, key=lambda item: item[0]):
+        digest.update(f'{name}\0{file_stat.st_mtime_ns}\0{file_stat.st_size}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+def build_project_data(chat_logs_dir, files=None):
+    """Read every conversation file and build the project list and summaries"""
+    if files is None:
+        files = scan_conversation_files(chat_logs_dir)
+    files = sorted(files, key=lambda item: item[1].st_mtime, reverse=True)  # Sort by modification time descending
+    
+    print(f"Found {len(files)} JSON files")  # Debug info
+    
+    project_summaries = []
+    project_map = {}
+    
+    for file, file_stat in files:
+        try:
+            file_path = os.path.join(chat_logs_dir, file)
+            project_summary = dict(load_conversation_summary(file_path, file_stat))
+            project_summary.setdefault('id', f'project-{len(project_summaries) + 1}')
+            project_summary.setdefault('title', f'Update {len(project_summaries) + 1}')
+            
+            project_summaries.append(project_summary)
+            
+            # Track project statistics
+            project_name = project_summary['projectName']
+            if project_name in project_map:
+                project_map[project_name]['updates'] += 1
+            else:
+                project_map[project_name] = {
+                    'name': project_name,
+                    'updates': 1,
+                    'status': 'Active'
+                }
+        
+        except Exception as e:
+            print(f'Error reading file {file}: {e}')
+            continue
+    
+    # Convert project map to array
+    projects = list(project_map.values())
+    
+    return {
+        'projects': projects,
+        'projectSummaries': project_summaries
+    }
+
+def read_catalog():
+    """Read the shared catalog file, or None if it is missing or unreadable"""
+    try:
+        with open(CATALOG_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_catalog(catalog):
+    """Atomically replace the shared catalog file"""
+    tmp_path = f'{CATALOG_PATH}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False)
+    os.replace(tmp_path, CATALOG_PATH)
+
+@contextmanager
+def catalog_lock():
+    """Hold an exclusive cross-process lock while the catalog is rebuilt"""
+    with open(CATALOG_LOCK_PATH, 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def load_catalog():
+    """
+    Return project data, rebuilding the shared catalog only when chat_logs changed
+    
+    Every worker fingerprints the conversation files by name, mtime and size
+    (one directory scan per request). A directory mtime alone would miss a
+    file rewritten in place, or two changes within one timestamp tick. When
+    the fingerprint differs, a single worker rebuilds the catalog under the
+    lock and the others pick up the file it wrote instead of rescanning the
+    disk themselves.
+    """
+    files = scan_conversation_files(CHAT_LOGS_DIR)
+    signature = source_signature(files)
+    if _catalog.get('source_signature') == signature:
+        return _catalog['data']
+    
+    catalog = read_catalog()
+    if not catalog or catalog.get('source_signature') != signature:
+        os.makedirs(os.path.dirname(CATALOG_PATH), exist_ok=True)
+        with catalog_lock():
+            # Another worker may have rebuilt it while we waited for the lock
+            catalog = read_catalog()
+            files = scan_conversation_files(CHAT_LOGS_DIR)
+            signature = source_signature(files)
+            if not catalog or catalog.get('source_signature') != signature:
+                # Built from the stats taken for the signature, so a file that
+                # changes mid-build makes the catalog stale again
+                catalog = {
+                    'source_signature': signature,
+                    'data': build_project_data(CHAT_LOGS_DIR, files)
+                }
+                write_catalog(catalog)
+    
+    _catalog.clear()
+    _catalog.update(catalog)
+    return catalog['data']
+
 @app.route('/api/projects')
 def get_projects():
     """Get project data API"""
     try:
-        chat_logs_dir = os.path.join(os.path.dirname(__file__), '..', 'MCP_Chat_Logger', 'chat_logs')
-        
         # Check if chat_logs directory exists
-        if not os.path.exists(chat_logs_dir):
+        if not os.path.exists(CHAT_LOGS_DIR):
             return jsonify({'projects': [], 'projectSummaries': []})
         
-        # Read all JSON files
-        files = [f for f in os.listdir(chat_logs_dir) if f.endswith('.json')]
-        files.sort(key=lambda x: os.path.getmtime(os.path.join(chat_logs_dir, x)), reverse=True)  # Sort by modification time descending
-        
-        print(f"Found {len(files)} JSON files: {files}")  # Debug info
-        
-        project_summaries = []
-        project_map = {}
+        return jsonify(load_catalog())
         
-        for file in files:
-            try:
-                file_path = os.path.join(chat_logs_dir, file)
-                print(f"Processing file: {file}")  # Debug info
-                
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                # Extract project information
-                project_name = data.get('project_name', 'Unknown Project')
-                tag = data.get('tag', 'other')
-                description = data.get('description', '')
-                before_code = data.get('before_code', '')
-                after_code = data.get('after_code', '')
-                title = data.get('title', f'Update {len(project_summaries) + 1}')
-                summary = data.get('summary', description)
-                timestamp = data.get('created_at', datetime.now().isoformat())
-                message_count = data.get('message_count', 0)
-                participants = data.get('participants', [])
-                
-                # Create project summary object
-                project_summary = {
-                    'id': data.get('conversation_id', f'project-{len(project_summaries) + 1}'),
+    except Exception as e:
+        print(f'Error reading project data: {e}')
+        return jsonify({'error': 'Failed to read project data'}), 500
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """Get hit/miss/eviction statistics for this worker's conversation cache"""
+    return jsonify(conversation_cache.stats())
+
+def open_index():
+    """Open the logger's SQLite index database"""
+    # Read-only, so the dashboard never blocks or modifies the logger's writes
+    return sqlite3.connect(f'file:{os.path.abspath(INDEX_DB_PATH)}?mode=ro', uri=True)
+
+def query_symbol_index(name, k):
+    """
+    Look up one name in the logger's SQLite symbol index
+    
+    Every save of a conversation is indexed, so matches are grouped by
+    conversation and only its newest file is kept. Each kind returns at
+    most k conversations, newest first; symbol matches carry the code blocks
+    that mention the name.
+    """
+    db = open_index()
+    try:
+        results = {}
+        for kind in ('symbols', 'files'):
+            rows = db.execute(
+                'SELECT file, conversation_id, project_name, title, created_at FROM ('
+                '  SELECT refs.file, c.conversation_id, c.project_name, c.title, c.created_at,'
+                '    ROW_NUMBER() OVER ('
+                '      PARTITION BY COALESCE(c.conversation_id, refs.file)'
+                '      ORDER BY c.created_at DESC, refs.file DESC'
+                '    ) AS newest'
+                '  FROM refs JOIN conversations AS c ON c.file = refs.file'
+                '  WHERE refs.name = ? AND refs.kind = ?'
+                ') WHERE newest = 1 ORDER BY created_at DESC LIMIT ?',
+                (name, kind, k)
+            ).fetchall()
+            
+            results[kind] = []
+            for file, conversation_id, project_name, title, created_at in rows:
+                result = {
+                    'id': conversation_id,
+                    'file': file,
                     'projectName': project_name,
                     'title': title,
-                    'summary': summary,
-                    'type': get_type_from_tag(tag),
-                    'timestamp': timestamp,
-                    'aiModel': 'Openai',
-                    'functions': extract_functions(data),
-                    'bugFixes': extract_bug_fixes(data),
-                    'tags': extract_tags(data),
-                    'codeChanges': format_code_changes(before_code, after_code),
-                    'impact': generate_impact_description(tag, description),
-                    'messageCount': message_count,
-                    'participants': participants
+                    'timestamp': created_at
                 }
-                
-                project_summaries.append(project_summary)
-                
-                # Track project statistics
-                if project_name in project_map:
-                    project_map[project_name]['updates'] += 1
-                else:
-                    project_map[project_name] = {
-                        'name': project_name,
-                        'updates': 1,
-                        'status': 'Active'
-                    }
-                    
-            except Exception as e:
-                print(f'Error reading file {file}: {e}')
+                if kind == 'symbols':
+                    result['codeBlocks'] = [
+                        {'language': language, 'code': code}
+                        for language, code in db.execute(
+                            'SELECT language, code FROM code_blocks WHERE file = ? AND instr(code, ?) > 0 ORDER BY position',
+                            (file, name)
+                        )
+                    ]
+                results[kind].append(result)
+    finally:
+        db.close()
+    return results
+
+@app.route('/api/symbols')
+def get_symbol_references():
+    """Find the conversations that touched a function, class or file name"""
+    name = request.args.get('name', '').strip().strip('`')
+    k = min(max(request.args.get('k', 20, type=int), 1), 100)
+    if not name:
+        return jsonify({'error': 'Missing required parameter: name'}), 400
+    
+    try:
+        if not os.path.exists(INDEX_DB_PATH):
+            return jsonify({'name': name, 'symbols': [], 'files': []})
+        
+        results = query_symbol_index(name, k)
+        return jsonify({'name': name, 'symbols': results['symbols'], 'files': results['files']})
+        
+    except Exception as e:
+        print(f'Error reading symbol index: {e}')
+        return jsonify({'error': 'Failed to read symbol index'}), 500
+
+def load_vector_index():
+    """
+    Return the memory-mapped vectors, metadata per row and rows per conversation id
+    
+    Only metadata appended since the previous call is parsed, so a save costs
+    each worker one new line rather than a re-read of the whole file.
+    """
+    files = (os.stat(VECTORS_PATH).st_ino, os.stat(VECTOR_METADATA_PATH).st_ino)
+    if _vectors.get('files') != files:
+        # First call, or the logger rebuilt the index
+        _vectors.clear()
+        _vectors.update({'files': files, 'offset': 0, 'vectors': None, 'metadata': [], 'rows_by_id': {}})
+    
+    # Metadata first: its vector is always written before it, so every row
+    # read here is covered by the vectors mapped below
+    if os.path.getsize(VECTOR_METADATA_PATH) > _vectors['offset']:
+        entries, _vectors['offset'] = vector_index.read_metadata(VECTOR_METADATA_PATH, _vectors['offset'])
+    else:
+        entries = []
+    
+    metadata = _vectors['metadata']
+    vectors = _vectors['vectors']
+    rows = os.path.getsize(VECTORS_PATH) // (vector_index.VECTOR_DIM * 4)
+    if vectors is None or len(vectors) != rows:
+        vectors = _vectors['vectors'] = vector_index.map_vectors(VECTORS_PATH)
+        # Rows without metadata (orphans of an interrupted append) stay None
+        metadata.extend([None] * (len(vectors) - len(metadata)))
+    
+    for info in entries:
+        row = info['row']
+        if row < len(metadata):
+            metadata[row] = info
+            _vectors['rows_by_id'].setdefault(info.get('conversation_id'), []).append(row)
+    return vectors, metadata, _vectors['rows_by_id']
+
+def search_conversations(vectors, metadata, query, k, exclude_id=None):
+    """
+    Return the k best (row, score) matches, one per conversation
+
+    Every save of a conversation has its own row, so more rows than k are
+    fetched, doubling until k distinct conversations are found or the
+    whole index has been ranked.
+    """
+    fetch = k * 4
+    while True:
+        best = {}
+        for row, score in vector_index.search(vectors, query, fetch):
+            info = metadata[row]
+            if info is None or (exclude_id and info.get('conversation_id') == exclude_id):
                 continue
+            # Matches come best first, so the first row seen for a conversation is its best
+            best.setdefault(info.get('conversation_id') or info.get('file'), (row, score))
+        if len(best) >= k or fetch >= len(vectors):
+            return list(best.values())[:k]
+        fetch *= 2
+
+@app.route('/api/similar')
+def get_similar_conversations():
+    """Find the conversations most similar to a text query or to a saved conversation"""
+    if vector_index is None:
+        return jsonify({'error': 'Similarity search requires NumPy'}), 503
+    
+    query_text = request.args.get('q', '').strip()
+    conversation_id = request.args.get('id', '').strip()
+    k = min(max(request.args.get('k', 10, type=int), 1), 100)
+    if not query_text and not conversation_id:
+        return jsonify({'error': 'Missing required parameter: q or id'}), 400
+    
+    try:
+        if not (os.path.exists(VECTORS_PATH) and os.path.exists(VECTOR_METADATA_PATH)):
+            # The logger writes the index only when it has NumPy installed
+            return jsonify({'error': 'Vector index not available; start the logger with NumPy installed'}), 503
         
-        # Convert project map to array
-        projects = list(project_map.values())
+        vectors, metadata, rows_by_id = load_vector_index()
         
-        return jsonify({
-            'projects': projects,
-            'projectSummaries': project_summaries
-        })
+        if conversation_id:
+            # Use the newest saved version of the conversation as the query
+            rows = rows_by_id.get(conversation_id, [])
+            if not rows:
+                return jsonify({'error': f'Conversation not found: {conversation_id}'}), 404
+            query = np.asarray(vectors[rows[-1]])
+            matches = search_conversations(vectors, metadata, query, k, exclude_id=conversation_id)
+        else:
+            query = vector_index.embed_texts([query_text])[0]
+            matches = search_conversations(vectors, metadata, query, k)
+        
+        results = []
+        for row, score in matches:
+            info = metadata[row]
+            results.append({
+                'id': info.get('conversation_id'),
+                'file': info.get('file'),
+                'projectName': info.get('project_name'),
+                'title': info.get('title'),
+                'timestamp': info.get('created_at'),
+                'score': round(score, 4)
+            })
+        
+        return jsonify({'results': results})
         
     except Exception as e:
-        print(f'Error reading project data: {e}')
-        return jsonify({'error': 'Failed to read project data'}), 500
+        print(f'Error searching similar conversations: {e}')
+        return jsonify({'error': 'Failed to search similar conversations'}), 500
+
+def top_counts(counter, limit=10):
+    """Return the most frequent entries of a count map as name/count pairs"""
+    ranked = sorted(counter.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{'name': name, 'count': count} for name, count in ranked]
+
+def index_signature():
+    """Modification times and sizes of the index database and its write-ahead log"""
+    signature = []
+    for path in (INDEX_DB_PATH, INDEX_DB_PATH + '-wal'):
+        try:
+            file_stat = os.stat(path)
+            signature.append((file_stat.st_mtime_ns, file_stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def build_project_stats(name):
+    """Read one project's aggregates from the index and shape them for the API"""
+    db = open_index()
+    try:
+        row = db.execute('SELECT data FROM project_stats WHERE project_name = ?', (name,)).fetchone()
+    finally:
+        db.close()
+    
+    project = json.loads(row[0]) if row else None
+    if not project:
+        return None
+    
+    # Type distribution is derived from the tag counts
+    types = {}
+    for tag, count in project.get('tags', {}).items():
+        project_type = get_type_from_tag(tag)
+        types[project_type] = types.get(project_type, 0) + count
+    
+    return {
+        'name': project['name'],
+        'updates': project['updates'],
+        'messageCount': project['message_count'],
+        'firstUpdate': project['first_update'],
+        'lastUpdate': project['last_update'],
+        'updatesPerDay': dict(sorted(project['updates_per_day'].items())),
+        'updatesPerWeek': dict(sorted(project['updates_per_week'].items())),
+        'tags': project['tags'],
+        'types': types,
+        'participants': project['participants'],
+        'topFunctions': top_counts(project['functions']),
+        'topFiles': top_counts(project['files'])
+    }
+
+@app.route('/api/projects/<path:name>/stats')
+def get_project_stats(name):
+    """
+    Get precomputed aggregates for a single project
+    
+    Results are cached until the index database or its write-ahead log
+    changes, so repeated requests cost two stat calls. Project names may
+    contain slashes.
+    """
+    try:
+        if not os.path.exists(INDEX_DB_PATH):
+            return jsonify({'error': 'Project stats not available yet'}), 404
+        
+        signature = index_signature()
+        if _project_stats['signature'] != signature:
+            _project_stats['signature'] = signature
+            _project_stats['projects'] = {}
+        
+        project = _project_stats['projects'].get(name)
+        if project is None:
+            project = build_project_stats(name)
+            if not project:
+                return jsonify({'error': f'Project not found: {name}'}), 404
+            _project_stats['projects'][name] = project
+        return jsonify(project)
+        
+    except Exception as e:
+        print(f'Error reading project stats: {e}')
+        return jsonify({'error': 'Failed to read project stats'}), 500
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5002)
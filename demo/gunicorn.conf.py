@@ -0,0 +1,15 @@
+# Gunicorn configuration for production serving of the dashboard
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# Workers share the catalog in chat_logs/index/catalog.json, so adding
+# workers does not multiply the cost of scanning chat_logs.
+import multiprocessing
+import os
+
+bind = os.getenv('DASHBOARD_BIND', '0.0.0.0:5002')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'sync'
+timeout = int(os.getenv('DASHBOARD_TIMEOUT', '30'))
+accesslog = os.getenv('DASHBOARD_ACCESS_LOG', None)
+errorlog = '-'
@@ -0,0 +1,44 @@
+"""
+Simple load test for the dashboard API
+
+Run it against the dev server and against gunicorn with different worker
+counts to compare throughput:
+
+    gunicorn -c gunicorn.conf.py -w 1 app:app
+    python load_test.py --requests 2000 --concurrency 16
+"""
+import argparse
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+def fetch(url):
+    """Fetch a URL and return whether it succeeded"""
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            return response.status == 200
+    except Exception:
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the dashboard API')
+    parser.add_argument('--url', default='http://127.0.0.1:5002/api/projects')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+    
+    # Warm up so the first catalog build is not counted
+    fetch(args.url)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(fetch, [args.url] * args.requests))
+    elapsed = time.perf_counter() - start
+    
+    failures = results.count(False)
+    print(f"Requests: {args.requests}, concurrency: {args.concurrency}, failures: {failures}")
+    print(f"Elapsed: {elapsed:.2f}s, requests/sec: {args.requests / elapsed:.1f}")
+
+if __name__ == '__main__':
+    main()